@@ -3,12 +3,22 @@ Python Flask API demonstrating On-Behalf-Of (OBO) flow
 This API receives a token from the React SPA and uses OBO to call Microsoft Graph
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request
+from flask.json.provider import JSONProvider
 from flask_cors import CORS
+from flask_compress import Compress
 import msal
 import requests
-import jwt
+from requests.adapters import HTTPAdapter
 import os
+import logging
+import base64
+import orjson
+import hashlib
+import threading
+import time
+import concurrent.futures
+from cachetools import TTLCache
 
 # Import centralized configuration
 from config import (
@@ -16,11 +26,26 @@ from config import (
     get_authority, get_client_id, get_client_secret,
     get_graph_scopes, get_search_scopes, get_search_endpoint,
     get_search_index, get_search_api_version, get_search_auth_mode,
-    get_search_api_key, QUERY_CONFIG
+    get_search_api_key, QUERY_CONFIG, CACHE_CONFIG, HTTP_CONFIG
 )
 
+class OrjsonProvider(JSONProvider):
+    """Flask JSON provider backed by orjson, used for parsing request bodies"""
+    
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+logging.basicConfig(level=SERVER_CONFIG["log_level"])
+logger = logging.getLogger(__name__)
+
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 CORS(app)  # Enable CORS for local development
+app.config["COMPRESS_MIN_SIZE"] = SERVER_CONFIG["compress_min_size"]
+Compress(app)  # Compress responses for clients that send Accept-Encoding
 
 # Configuration shortcuts for backward compatibility
 CLIENT_ID = get_client_id()
@@ -28,13 +53,254 @@ CLIENT_SECRET = get_client_secret()
 TENANT_ID = AZURE_AD_CONFIG["tenant_id"]
 AUTHORITY = get_authority()
 SCOPE = get_graph_scopes()
+SCOPE_TUPLE = tuple(SCOPE)
+
+# Microsoft Graph endpoints
+GRAPH_ME_URL = GRAPH_CONFIG["me_endpoint"]
+GRAPH_MEMBER_OF_URL = GRAPH_CONFIG["member_of_endpoint"]
+GRAPH_BATCH_URL = GRAPH_CONFIG["batch_endpoint"]
 
 # Azure AI Search Configuration
 SEARCH_ENDPOINT = get_search_endpoint()
 SEARCH_INDEX = get_search_index()
 SEARCH_SCOPE = get_search_scopes()
+SEARCH_SCOPE_TUPLE = tuple(SEARCH_SCOPE)
 SEARCH_API_KEY = get_search_api_key()
 SEARCH_AUTH_MODE = get_search_auth_mode()
+SEARCH_URL = f"{SEARCH_ENDPOINT}/indexes/{SEARCH_INDEX}/docs/search?api-version={get_search_api_version()}"
+
+# Request headers for Azure AI Search; the API key variant never changes per request
+SEARCH_HEADERS_TEMPLATE = {"Content-Type": "application/json"}
+SEARCH_API_KEY_HEADERS = {**SEARCH_HEADERS_TEMPLATE, "api-key": SEARCH_API_KEY}
+
+def _json(obj, status=200):
+    """Serialize a response body with orjson"""
+    return Response(orjson.dumps(obj), status=status, mimetype='application/json')
+
+# Shared HTTP sessions
+# Keep-alive connections to Graph and AI Search are pooled across requests so
+# each downstream call doesn't pay for a new TCP + TLS handshake
+def _create_session():
+    """Create a requests session with a pooled HTTPS adapter"""
+    session = requests.Session()
+    session.mount('https://', HTTPAdapter(
+        pool_connections=HTTP_CONFIG["pool_connections"],
+        pool_maxsize=HTTP_CONFIG["pool_maxsize"]
+    ))
+    return session
+
+GRAPH_SESSION = _create_session()
+GRAPH_SESSION.headers.update({"Accept": "application/json"})
+SEARCH_SESSION = _create_session()
+
+# Worker pool for overlapping independent downstream calls
+_EXEC = concurrent.futures.ThreadPoolExecutor(max_workers=HTTP_CONFIG["max_workers"])
+
+def _get_graph_json(url, headers):
+    """Call a Graph endpoint and return (status, body), parsing the body only on success"""
+    response = GRAPH_SESSION.get(url, headers=headers)
+    body = orjson.loads(response.content) if response.status_code == 200 else {}
+    return response.status_code, body
+
+def _get_me_and_groups(headers, include_groups=True):
+    """
+    Fetch /me and /me/memberOf from Microsoft Graph
+    Sent as one JSON batch request, or as two concurrent calls when batching is disabled
+    With include_groups=False only /me is called and the groups result is (None, {})
+    Returns ((me_status, me_body), (groups_status, groups_body))
+    """
+    if not include_groups:
+        return _get_graph_json(GRAPH_ME_URL, headers), (None, {})
+    
+    if GRAPH_CONFIG["use_batch"]:
+        batch_payload = {
+            "requests": [
+                {"id": "me", "method": "GET", "url": "/me"},
+                {"id": "memberOf", "method": "GET", "url": "/me/memberOf"}
+            ]
+        }
+        batch_response = GRAPH_SESSION.post(GRAPH_BATCH_URL, headers=headers, json=batch_payload)
+        if batch_response.status_code != 200:
+            return (batch_response.status_code, {}), (batch_response.status_code, {})
+        
+        batch_results = {item.get("id"): item for item in orjson.loads(batch_response.content).get("responses", [])}
+        me = batch_results.get("me", {})
+        groups = batch_results.get("memberOf", {})
+        return (me.get("status"), me.get("body", {})), (groups.get("status"), groups.get("body", {}))
+    
+    urls = [GRAPH_ME_URL, GRAPH_MEMBER_OF_URL]
+    futures = [_EXEC.submit(_get_graph_json, url, headers) for url in urls]
+    results = []
+    for url, future in zip(urls, futures):
+        try:
+            results.append(future.result(timeout=GRAPH_CONFIG["request_timeout_seconds"]))
+        except concurrent.futures.TimeoutError:
+            # cancel() only succeeds if the call never left the queue (pool saturated),
+            # in which case it runs inline; a call already in flight is left to finish
+            if future.cancel():
+                results.append(_get_graph_json(url, headers))
+            else:
+                results.append(future.result())
+    return results[0], results[1]
+
+class BoundedTokenCache(msal.TokenCache):
+    """
+    In-memory MSAL token cache holding at most max_entries of each credential type
+    Entries are kept in write order and the least recently written are evicted first
+    """
+    
+    def __init__(self, max_entries):
+        super().__init__()
+        self.max_entries = max_entries
+    
+    def modify(self, credential_type, old_entry, new_key_value_pairs=None):
+        # MSAL routes every add, update and removal through modify()
+        with self._lock:
+            entries = self._cache.setdefault(credential_type, {})
+            if new_key_value_pairs:
+                # Re-insert rather than update in place so dict order tracks recency
+                entries.pop(self.key_makers[credential_type](**old_entry), None)
+            super().modify(credential_type, old_entry, new_key_value_pairs)
+            while len(entries) > self.max_entries:
+                entries.pop(next(iter(entries)))
+
+# Shared MSAL client
+# Created on first use rather than at import time, since construction performs
+# authority discovery against Azure AD
+MSAL_APP = None
+_msal_app_lock = threading.Lock()
+
+def _get_msal_app():
+    """Get the shared confidential client application, creating it on first use"""
+    global MSAL_APP
+    if MSAL_APP is None:
+        with _msal_app_lock:
+            if MSAL_APP is None:
+                MSAL_APP = msal.ConfidentialClientApplication(
+                    CLIENT_ID,
+                    authority=AUTHORITY,
+                    client_credential=CLIENT_SECRET,
+                    token_cache=BoundedTokenCache(CACHE_CONFIG["msal_max_entries"])
+                )
+    return MSAL_APP
+
+def _token_key(token):
+    """Compact cache key for a bearer token (16-byte BLAKE2b digest)"""
+    return hashlib.blake2b(token.encode(), digest_size=16).digest()
+
+# OBO token caching
+# OBO results are memoized per (incoming assertion, scopes) so repeat calls
+# skip the round-trip to Azure AD. Concurrent misses for the same key share a
+# single in-flight exchange instead of each calling Azure AD.
+_obo_cache = TTLCache(maxsize=CACHE_CONFIG["obo_max_entries"], ttl=CACHE_CONFIG["obo_ttl_seconds"])
+_obo_in_flight = {}
+_obo_cache_lock = threading.Lock()
+
+def _acquire_obo(user_token, scopes):
+    """
+    Exchange the incoming user token for a downstream token via OBO
+    Returns a cached result while the downstream token is still valid
+    scopes must be a tuple (e.g. SCOPE_TUPLE) since it is part of the cache key
+    """
+    key = (_token_key(user_token), scopes)
+    with _obo_cache_lock:
+        cached = _obo_cache.get(key)
+        if cached and cached["expires_at"] > time.time() + CACHE_CONFIG["obo_expiry_margin_seconds"]:
+            return cached["result"]
+        
+        future = _obo_in_flight.get(key)
+        is_leader = future is None
+        if is_leader:
+            future = concurrent.futures.Future()
+            _obo_in_flight[key] = future
+    
+    if not is_leader:
+        # Another request is already exchanging this assertion; share its result
+        return future.result()
+    
+    try:
+        result = _get_msal_app().acquire_token_on_behalf_of(
+            user_assertion=user_token,
+            scopes=scopes
+        )
+        
+        # Only successful exchanges are cached; errors are retried on the next request.
+        # The entry also expires with the incoming assertion, since the OBO exchange is
+        # the only place an expired or revoked caller token gets rejected
+        expires_at = None
+        if "access_token" in result:
+            expires_at = min(
+                time.time() + result.get("expires_in", 3600),
+                _decode_unverified(user_token).get("exp", 0)
+            )
+    except BaseException as e:
+        with _obo_cache_lock:
+            _obo_in_flight.pop(key, None)
+        future.set_exception(e)
+        raise
+    
+    with _obo_cache_lock:
+        if expires_at is not None:
+            _obo_cache[key] = {
+                "result": result,
+                "expires_at": expires_at
+            }
+        _obo_in_flight.pop(key, None)
+    future.set_result(result)
+    return result
+
+# Decoded claims are memoized per token, since the same user sends the same token
+# on every request until it expires
+_decode_cache = TTLCache(maxsize=CACHE_CONFIG["decode_max_entries"], ttl=CACHE_CONFIG["decode_ttl_seconds"])
+_decode_cache_lock = threading.Lock()
+
+def _claims(token):
+    """Parse the payload segment of a JWT without verifying its signature"""
+    payload = token.split('.')[1]
+    payload += '=' * (-len(payload) % 4)
+    return orjson.loads(base64.urlsafe_b64decode(payload))
+
+def _decode_unverified(token):
+    """
+    Decode a JWT without signature verification, reusing previously decoded claims
+    The returned dict is shared between requests and must not be modified
+    """
+    key = _token_key(token)
+    with _decode_cache_lock:
+        claims = _decode_cache.get(key)
+    if claims is None:
+        claims = _claims(token)
+        with _decode_cache_lock:
+            _decode_cache[key] = claims
+    return claims
+
+# Static response text, shared by every request to the corresponding endpoint
+_HELLO_MESSAGE = "Hello World from Python OBO API!"
+_HELLO_FLOW = "On-Behalf-Of (OBO) Flow Successful"
+_HELLO_DESCRIPTION = "This shows both the incoming token (from React) and the OBO token (for Graph)"
+_HELLO_NOTE = "Graph tokens don't include group claims. Groups must be queried via /me/memberOf API."
+_HELLO_NOTE_FROM_TOKEN = "Graph tokens don't include group claims. The incoming token already carried the user's groups, so the /me/memberOf call was skipped."
+_INCOMING_TOKEN_TYPE = "Access token for Python API"
+_GRAPH_TOKEN_TYPE = "OBO Access token for Microsoft Graph"
+_OBTAINED_VIA_OBO = "On-Behalf-Of flow"
+_SEARCH_OBO_MESSAGE = "AI Search completed successfully using OBO flow"
+_SEARCH_OBO_FLOW = "React SPA -> Python API (OBO) -> Azure AI Search"
+_SEARCH_SIMPLE_MESSAGE = "AI Search completed successfully (using API key)"
+_SEARCH_SIMPLE_FLOW = "React SPA -> Python API -> Azure AI Search (with API key)"
+_SEARCH_UNIFIED_MESSAGE = "AI Search completed successfully"
+_AUTH_METHOD_OBO = "OBO Flow with Query-Time Access Control"
+_AUTH_METHOD_API_KEY = "API Key"
+_SEARCH_UNIFIED_FLOWS = {
+    method: f"React SPA -> Python API ({method}) -> Azure AI Search"
+    for method in (_AUTH_METHOD_OBO, _AUTH_METHOD_API_KEY)
+}
+_QUERY_TIME_ACCESS_DESCRIPTION = "Query-time access control: Azure AI Search evaluates GroupIds/UserIds based on user's token"
+_QUERY_TIME_ACCESS_NOTE = "Azure AI Search evaluates access based on x-ms-query-source-authorization header"
+_QUERY_TIME_ACCESS_METHOD = "query-time access control"
+_UNIFIED_GROUPS_SOURCE = "Incoming token from React (not from OBO token)"
+_UNIFIED_INCOMING_TOKEN_TYPE = "Incoming Access Token from React (contains groups)"
+_SEARCH_TOKEN_TYPE = "OBO Access Token for Azure AI Search (scoped for search, no groups)"
+_HEALTH_MESSAGE = "Python OBO API is running"
 
 @app.route('/api/hello', methods=['GET'])
 def hello():
@@ -50,75 +316,66 @@ def hello():
     auth_header = request.headers.get('Authorization')
     
     if not auth_header or not auth_header.startswith('Bearer '):
-        return jsonify({
+        return _json({
             "error": "Missing or invalid Authorization header"
-        }), 401
+        }, 401)
     
     # Get the token (remove "Bearer " prefix)
     user_access_token = auth_header.split(' ')[1]
     
     try:
         # Step 2: Use the OBO flow to get a token for Microsoft Graph
-        # Create a confidential client application
-        msal_app = msal.ConfidentialClientApplication(
-            CLIENT_ID,
-            authority=AUTHORITY,
-            client_credential=CLIENT_SECRET
-        )
-        
-        # Perform OBO token exchange
-        result = msal_app.acquire_token_on_behalf_of(
-            user_assertion=user_access_token,
-            scopes=SCOPE
-        )
+        result = _acquire_obo(user_access_token, SCOPE_TUPLE)
         
         if "access_token" not in result:
             error_description = result.get("error_description", "Unknown error")
-            return jsonify({
+            return _json({
                 "error": "OBO token acquisition failed",
                 "details": error_description
-            }), 500
+            }, 500)
         
         graph_access_token = result['access_token']
         
         # Decode both tokens to compare them
-        incoming_token_decoded = jwt.decode(user_access_token, options={"verify_signature": False})
-        obo_token_decoded = jwt.decode(graph_access_token, options={"verify_signature": False})
+        incoming_token_decoded = _decode_unverified(user_access_token)
+        obo_token_decoded = _decode_unverified(graph_access_token)
+        incoming_groups = incoming_token_decoded.get("groups", [])
+        
+        # Groups only need to be queried if the incoming token doesn't carry them,
+        # either because group claims aren't configured or because of a groups overage
+        # (signalled by "_claim_names" when the user is in too many groups)
+        query_groups = not incoming_groups or "_claim_names" in incoming_token_decoded
         
         # Step 3: Call Microsoft Graph with the new token
-        graph_endpoint = "https://graph.microsoft.com/v1.0/me"
+        # Also queries the user's groups via /me/memberOf (GroupMember.Read.All permission)
         headers = {
             'Authorization': f'Bearer {graph_access_token}'
         }
         
-        graph_response = requests.get(graph_endpoint, headers=headers)
+        (graph_status, user_data), (groups_status, groups_data) = _get_me_and_groups(headers, include_groups=query_groups)
         
-        if graph_response.status_code != 200:
-            return jsonify({
+        if graph_status != 200:
+            return _json({
                 "error": "Failed to call Microsoft Graph",
-                "status": graph_response.status_code
-            }), 500
+                "status": graph_status
+            }, 500)
         
-        user_data = graph_response.json()
-        
-        # Step 3b: Query user's groups using the OBO token with GroupMember.Read.All permission
-        groups_endpoint = "https://graph.microsoft.com/v1.0/me/memberOf"
-        groups_response = requests.get(groups_endpoint, headers=headers)
+        # Step 3b: Extract the user's groups from the /me/memberOf response
         obo_queried_groups = []
-        if groups_response.status_code == 200:
-            groups_data = groups_response.json()
+        if not query_groups:
+            obo_queried_groups = incoming_groups
+        elif groups_status == 200:
             obo_queried_groups = [group.get('id') for group in groups_data.get('value', []) if group.get('@odata.type') == '#microsoft.graph.group']
         
         # Step 4: Extract claims from both tokens
-        incoming_groups = incoming_token_decoded.get("groups", [])
         incoming_roles = incoming_token_decoded.get("roles", [])
         obo_groups = obo_token_decoded.get("groups", [])
         obo_roles = obo_token_decoded.get("roles", [])
         
         # Step 5: Return combined result with token information
-        return jsonify({
-            "message": "Hello World from Python OBO API!",
-            "flow": "On-Behalf-Of (OBO) Flow Successful",
+        return _json({
+            "message": _HELLO_MESSAGE,
+            "flow": _HELLO_FLOW,
             "user_info": {
                 "displayName": user_data.get("displayName"),
                 "userPrincipalName": user_data.get("userPrincipalName"),
@@ -133,7 +390,7 @@ def hello():
                 "groups": incoming_groups,
                 "roles": incoming_roles,
                 "group_count": len(incoming_groups),
-                "token_type": "Access token for Python API"
+                "token_type": _INCOMING_TOKEN_TYPE
             },
             "obo_token_info": {
                 "aud": obo_token_decoded.get("aud"),
@@ -145,9 +402,9 @@ def hello():
                 "groups_queried_via_api": obo_queried_groups,
                 "groups_queried_count": len(obo_queried_groups),
                 "roles": obo_roles,
-                "token_type": "OBO Access token for Microsoft Graph",
-                "obtained_via": "On-Behalf-Of flow",
-                "note": "Graph tokens don't include group claims. Groups must be queried via /me/memberOf API."
+                "token_type": _GRAPH_TOKEN_TYPE,
+                "obtained_via": _OBTAINED_VIA_OBO,
+                "note": _HELLO_NOTE if query_groups else _HELLO_NOTE_FROM_TOKEN
             },
             "token_comparison": {
                 "same_user": incoming_token_decoded.get("oid") == obo_token_decoded.get("oid"),
@@ -155,14 +412,14 @@ def hello():
                 "incoming_audience": incoming_token_decoded.get("aud"),
                 "obo_audience": obo_token_decoded.get("aud")
             },
-            "description": "This shows both the incoming token (from React) and the OBO token (for Graph)"
-        }), 200
+            "description": _HELLO_DESCRIPTION
+        }, 200)
         
     except Exception as e:
-        return jsonify({
+        return _json({
             "error": "Exception occurred",
             "details": str(e)
-        }), 500
+        }, 500)
 
 @app.route('/api/search', methods=['POST'])
 def search_with_obo():
@@ -178,52 +435,44 @@ def search_with_obo():
         # Step 1: Extract the incoming access token
         auth_header = request.headers.get('Authorization')
         if not auth_header or not auth_header.startswith('Bearer '):
-            return jsonify({"error": "No authorization token provided"}), 401
+            return _json({"error": "No authorization token provided"}, 401)
         
         user_access_token = auth_header.split(' ')[1]
         
         # Step 2: Use OBO to get token for AI Search
-        msal_app = msal.ConfidentialClientApplication(
-            CLIENT_ID,
-            authority=AUTHORITY,
-            client_credential=CLIENT_SECRET
-        )
+        result = _acquire_obo(user_access_token, SEARCH_SCOPE_TUPLE)
         
-        result = msal_app.acquire_token_on_behalf_of(
-            user_assertion=user_access_token,
-            scopes=SEARCH_SCOPE
-        )
-        
-        if "error" in result:
+        if "access_token" not in result:
             error_description = result.get("error_description", "Unknown error")
             error_code = result.get("error")
-            print(f"OBO Error for AI Search: {error_code}")
-            print(f"Error Description: {error_description}")
-            print(f"Scopes requested: {SEARCH_SCOPE}")
-            return jsonify({
+            logger.warning("OBO Error for AI Search: %s, Description: %s, Scopes requested: %s",
+                           error_code, error_description, SEARCH_SCOPE)
+            return _json({
                 "error": "OBO token acquisition failed for AI Search",
                 "details": error_description,
                 "error_code": error_code,
                 "scopes_requested": SEARCH_SCOPE,
                 "suggestion": "Check if Azure AD permission 'https://search.azure.com/user_impersonation' is granted and consented"
-            }), 500
+            }, 500)
         
         search_access_token = result['access_token']
         
         # Step 3: Extract user's groups from original token for filtering
-        token_decoded = jwt.decode(user_access_token, options={"verify_signature": False})
+        token_decoded = _decode_unverified(user_access_token)
         user_groups = token_decoded.get("groups", [])
         user_oid = token_decoded.get("oid")
         user_upn = token_decoded.get("upn")
         
         # Step 4: Get search query from request
-        request_data = request.get_json()
+        request_data = request.get_json(cache=True, silent=True) or {}
         search_query = request_data.get("query", "*")
         
         # Step 5: Build security filter based on user's groups
         if user_groups:
-            group_filters = " or ".join([f"g eq '{group}'" for group in user_groups])
-            security_filter = f"security_groups/any(g: {group_filters})"
+            # search.in is evaluated as a set lookup, unlike a chain of "g eq ..." clauses
+            # Group IDs are GUIDs; quotes are escaped so the OData literal stays intact
+            group_list = ",".join(user_groups).replace("'", "''")
+            security_filter = f"security_groups/any(g: search.in(g, '{group_list}', ','))"
             filter_description = f"User can see documents where security_groups contains one of their {len(user_groups)} group(s)"
         else:
             # If user has no groups, don't apply a filter (show all results)
@@ -231,16 +480,13 @@ def search_with_obo():
             filter_description = "User has no groups, showing all documents (no security filter)"
         
         # Step 6: Call AI Search with OBO token
-        search_url = f"{SEARCH_ENDPOINT}/indexes/{SEARCH_INDEX}/docs/search?api-version={get_search_api_version()}"
-        
-        headers = {
-            "Authorization": f"Bearer {search_access_token}",
-            "Content-Type": "application/json"
-        }
+        headers = SEARCH_HEADERS_TEMPLATE.copy()
+        headers["Authorization"] = f"Bearer {search_access_token}"
         
         payload = {
             "search": search_query,
-            "select": "*",
+            # Return only the configured fields unless the client asks for full documents
+            "select": "*" if request_data.get("full_fields") else QUERY_CONFIG["select_fields"],
             "top": QUERY_CONFIG["default_top"],
             "queryType": QUERY_CONFIG["default_query_type"]
         }
@@ -250,21 +496,22 @@ def search_with_obo():
             payload["filter"] = security_filter
         
         # Step 7: Make the request
-        search_response = requests.post(search_url, headers=headers, json=payload)
+        search_response = SEARCH_SESSION.post(SEARCH_URL, headers=headers, json=payload)
         
         if search_response.status_code != 200:
-            return jsonify({
+            return _json({
                 "error": "AI Search request failed",
                 "status": search_response.status_code,
                 "details": search_response.text
-            }), search_response.status_code
+            }, search_response.status_code)
         
-        search_results = search_response.json()
+        search_results = orjson.loads(search_response.content)
+        documents = search_results.get("value", [])
         
         # Step 8: Return combined results
-        return jsonify({
-            "message": "AI Search completed successfully using OBO flow",
-            "flow": "React SPA -> Python API (OBO) -> Azure AI Search",
+        return _json({
+            "message": _SEARCH_OBO_MESSAGE,
+            "flow": _SEARCH_OBO_FLOW,
             "user_context": {
                 "oid": user_oid,
                 "upn": user_upn,
@@ -276,15 +523,15 @@ def search_with_obo():
                 "description": filter_description
             },
             "search_query": search_query,
-            "result_count": search_results.get("@odata.count", len(search_results.get("value", []))),
-            "results": search_results.get("value", [])
-        }), 200
+            "result_count": search_results.get("@odata.count", len(documents)),
+            "results": documents
+        }, 200)
         
     except Exception as e:
-        return jsonify({
+        return _json({
             "error": "Exception occurred",
             "details": str(e)
-        }), 500
+        }, 500)
 
 @app.route('/api/search-simple', methods=['POST'])
 def search_simple():
@@ -293,36 +540,37 @@ def search_simple():
     Still demonstrates security filtering based on user groups
     """
     try:
-        print(f"Search endpoint called")
-        print(f"SEARCH_API_KEY configured: {bool(SEARCH_API_KEY)}")
+        logger.debug("Search endpoint called, SEARCH_API_KEY configured: %s", bool(SEARCH_API_KEY))
         
         if not SEARCH_API_KEY:
-            return jsonify({
+            return _json({
                 "error": "SEARCH_API_KEY not configured",
                 "instruction": "Set SEARCH_API_KEY environment variable with your AI Search admin or query key"
-            }), 500
+            }, 500)
         
         # Extract user's groups from token for security filtering
         auth_header = request.headers.get('Authorization')
         if not auth_header or not auth_header.startswith('Bearer '):
-            return jsonify({"error": "No authorization token provided"}), 401
+            return _json({"error": "No authorization token provided"}, 401)
         
         user_access_token = auth_header.split(' ')[1]
-        token_decoded = jwt.decode(user_access_token, options={"verify_signature": False})
+        token_decoded = _decode_unverified(user_access_token)
         user_groups = token_decoded.get("groups", [])
         user_oid = token_decoded.get("oid")
         user_upn = token_decoded.get("upn")
         
-        print(f"User: {user_upn}, Groups: {len(user_groups)}")
+        logger.debug("User: %s, Groups: %d", user_upn, len(user_groups))
         
         # Get search query
-        request_data = request.get_json()
+        request_data = request.get_json(cache=True, silent=True) or {}
         search_query = request_data.get("query", "*")
         
         # Build security filter
         if user_groups:
-            group_filters = " or ".join([f"g eq '{group}'" for group in user_groups])
-            security_filter = f"security_groups/any(g: {group_filters})"
+            # search.in is evaluated as a set lookup, unlike a chain of "g eq ..." clauses
+            # Group IDs are GUIDs; quotes are escaped so the OData literal stays intact
+            group_list = ",".join(user_groups).replace("'", "''")
+            security_filter = f"security_groups/any(g: search.in(g, '{group_list}', ','))"
             filter_description = f"User can see documents where security_groups contains one of their {len(user_groups)} group(s)"
         else:
             # If user has no groups, don't apply a filter (show all results)
@@ -331,16 +579,12 @@ def search_simple():
             filter_description = "User has no groups, showing all documents (no security filter)"
         
         # Call AI Search with API key (no OBO)
-        search_url = f"{SEARCH_ENDPOINT}/indexes/{SEARCH_INDEX}/docs/search?api-version={get_search_api_version()}"
-        
-        headers = {
-            "api-key": SEARCH_API_KEY,
-            "Content-Type": "application/json"
-        }
+        headers = SEARCH_API_KEY_HEADERS
         
         payload = {
             "search": search_query,
-            "select": "*",
+            # Return only the configured fields unless the client asks for full documents
+            "select": "*" if request_data.get("full_fields") else QUERY_CONFIG["select_fields"],
             "top": QUERY_CONFIG["default_top"],
             "queryType": QUERY_CONFIG["default_query_type"]
         }
@@ -349,26 +593,26 @@ def search_simple():
         if security_filter:
             payload["filter"] = security_filter
         
-        print(f"Calling AI Search: {search_url}")
-        print(f"Security filter: {security_filter}")
+        logger.debug("Calling AI Search: %s, Security filter: %s", SEARCH_URL, security_filter)
         
-        search_response = requests.post(search_url, headers=headers, json=payload)
+        search_response = SEARCH_SESSION.post(SEARCH_URL, headers=headers, json=payload)
         
-        print(f"AI Search response status: {search_response.status_code}")
+        logger.debug("AI Search response status: %d", search_response.status_code)
         
         if search_response.status_code != 200:
-            print(f"AI Search error: {search_response.text}")
-            return jsonify({
+            logger.warning("AI Search error: %s", search_response.text)
+            return _json({
                 "error": "AI Search request failed",
                 "status": search_response.status_code,
                 "details": search_response.text
-            }), search_response.status_code
+            }, search_response.status_code)
         
-        search_results = search_response.json()
+        search_results = orjson.loads(search_response.content)
+        documents = search_results.get("value", [])
         
-        return jsonify({
-            "message": "AI Search completed successfully (using API key)",
-            "flow": "React SPA -> Python API -> Azure AI Search (with API key)",
+        return _json({
+            "message": _SEARCH_SIMPLE_MESSAGE,
+            "flow": _SEARCH_SIMPLE_FLOW,
             "user_context": {
                 "oid": user_oid,
                 "upn": user_upn,
@@ -380,15 +624,15 @@ def search_simple():
                 "description": filter_description
             },
             "search_query": search_query,
-            "result_count": search_results.get("@odata.count", len(search_results.get("value", []))),
-            "results": search_results.get("value", [])
-        }), 200
+            "result_count": search_results.get("@odata.count", len(documents)),
+            "results": documents
+        }, 200)
         
     except Exception as e:
-        return jsonify({
+        return _json({
             "error": "Exception occurred",
             "details": str(e)
-        }), 500
+        }, 500)
 
 @app.route('/api/search-unified', methods=['POST'])
 def search_unified():
@@ -397,92 +641,77 @@ def search_unified():
     Controlled by SEARCH_AUTH_MODE environment variable
     """
     try:
-        print(f"Unified search endpoint called with mode: {SEARCH_AUTH_MODE}")
+        logger.debug("Unified search endpoint called with mode: %s", SEARCH_AUTH_MODE)
         
         # Extract user's access token and groups
         auth_header = request.headers.get('Authorization')
         if not auth_header or not auth_header.startswith('Bearer '):
-            return jsonify({"error": "No authorization token provided"}), 401
+            return _json({"error": "No authorization token provided"}, 401)
         
         user_access_token = auth_header.split(' ')[1]
         
+        # Fail fast if API key mode is selected but no key is configured
+        if SEARCH_AUTH_MODE != "OBO" and not SEARCH_API_KEY:
+            return _json({
+                "error": "SEARCH_API_KEY not configured",
+                "instruction": "Set SEARCH_API_KEY environment variable or use SEARCH_AUTH_MODE=OBO"
+            }, 500)
+        
         # Decode the INCOMING token from React (contains user's groups)
         # NOTE: Groups come from THIS token, not from the Azure Search OBO token
         # The Azure Search OBO token is scoped for search and won't contain group claims
-        token_decoded = jwt.decode(user_access_token, options={"verify_signature": False})
+        token_decoded = _decode_unverified(user_access_token)
         user_groups = token_decoded.get("groups", [])
         user_oid = token_decoded.get("oid")
         user_upn = token_decoded.get("upn")
         
         # Get search query
-        request_data = request.get_json()
+        request_data = request.get_json(cache=True, silent=True) or {}
         search_query = request_data.get("query", "*")
         
-        print(f"User: {user_upn} (OID: {user_oid}), Groups from incoming token: {len(user_groups)}, Query: {search_query}")
+        logger.debug("User: %s (OID: %s), Groups from incoming token: %d, Query: %s",
+                     user_upn, user_oid, len(user_groups), search_query)
         
         # Using query-time access control - Azure AI Search handles filtering based on token
         # No manual filter construction needed
-        filter_description = "Query-time access control: Azure AI Search evaluates GroupIds/UserIds based on user's token"
+        filter_description = _QUERY_TIME_ACCESS_DESCRIPTION
         
         # Choose authentication method
+        search_token_decoded = None
         if SEARCH_AUTH_MODE == "OBO":
             # Use OBO flow
-            print("Using OBO authentication for AI Search")
-            msal_app = msal.ConfidentialClientApplication(
-                CLIENT_ID,
-                authority=AUTHORITY,
-                client_credential=CLIENT_SECRET
-            )
-            
-            result = msal_app.acquire_token_on_behalf_of(
-                user_assertion=user_access_token,
-                scopes=SEARCH_SCOPE
-            )
+            logger.debug("Using OBO authentication for AI Search")
+            result = _acquire_obo(user_access_token, SEARCH_SCOPE_TUPLE)
             
-            if "error" in result:
+            if "access_token" not in result:
                 error_description = result.get("error_description", "Unknown error")
                 error_code = result.get("error")
                 correlation_id = result.get("correlation_id", "N/A")
-                print(f"OBO Error for AI Search: {error_code}")
-                print(f"Error Description: {error_description}")
-                print(f"Correlation ID: {correlation_id}")
-                print(f"Scopes requested: {SEARCH_SCOPE}")
-                return jsonify({
+                logger.warning("OBO Error for AI Search: %s, Description: %s, Correlation ID: %s, Scopes requested: %s",
+                               error_code, error_description, correlation_id, SEARCH_SCOPE)
+                return _json({
                     "error": "OBO token acquisition failed for AI Search",
                     "details": error_description,
                     "error_code": error_code,
                     "correlation_id": correlation_id,
                     "scopes_requested": SEARCH_SCOPE,
                     "suggestion": "The 'invalid_grant' error often means the Azure AD permission isn't configured or consented. Try setting SEARCH_AUTH_MODE=API_KEY as a workaround."
-                }), 500
+                }, 500)
             
             search_access_token = result['access_token']
             # Decode the OBO token for inspection
-            search_token_decoded = jwt.decode(search_access_token, options={"verify_signature": False})
-            headers = {
-                "Authorization": f"Bearer {search_access_token}",
-                "x-ms-query-source-authorization": search_access_token,
-                "Content-Type": "application/json"
-            }
-            auth_method = "OBO Flow with Query-Time Access Control"
+            search_token_decoded = _decode_unverified(search_access_token)
+            headers = SEARCH_HEADERS_TEMPLATE.copy()
+            headers["Authorization"] = f"Bearer {search_access_token}"
+            headers["x-ms-query-source-authorization"] = search_access_token
+            auth_method = _AUTH_METHOD_OBO
         else:
             # Use API Key
-            print("Using API Key authentication for AI Search")
-            if not SEARCH_API_KEY:
-                return jsonify({
-                    "error": "SEARCH_API_KEY not configured",
-                    "instruction": "Set SEARCH_API_KEY environment variable or use SEARCH_AUTH_MODE=OBO"
-                }), 500
-            
-            headers = {
-                "api-key": SEARCH_API_KEY,
-                "Content-Type": "application/json"
-            }
-            auth_method = "API Key"
+            logger.debug("Using API Key authentication for AI Search")
+            headers = SEARCH_API_KEY_HEADERS
+            auth_method = _AUTH_METHOD_API_KEY
         
         # Call AI Search with query-time access control
-        search_url = f"{SEARCH_ENDPOINT}/indexes/{SEARCH_INDEX}/docs/search?api-version={get_search_api_version()}"
-        
         payload = {
             "search": search_query,
             "select": QUERY_CONFIG["select_fields"],
@@ -492,17 +721,16 @@ def search_unified():
         }
         # No manual filter needed - Azure AI Search handles access control based on x-ms-query-source-authorization header
         
-        print(f"Calling AI Search with {auth_method}")
-        print(f"Access control: {filter_description}")
-        print(f"Search URL: {search_url}")
+        logger.debug("Calling AI Search with %s, Access control: %s, Search URL: %s",
+                     auth_method, filter_description, SEARCH_URL)
         
-        search_response = requests.post(search_url, headers=headers, json=payload)
+        search_response = SEARCH_SESSION.post(SEARCH_URL, headers=headers, json=payload)
         
-        print(f"AI Search response status: {search_response.status_code}")
+        logger.debug("AI Search response status: %d", search_response.status_code)
         
         if search_response.status_code != 200:
             error_detail = search_response.text
-            print(f"AI Search error ({search_response.status_code}): {error_detail}")
+            logger.warning("AI Search error (%d): %s", search_response.status_code, error_detail)
             
             # Add specific guidance for 403 errors
             if search_response.status_code == 403:
@@ -512,39 +740,40 @@ def search_unified():
             else:
                 suggestion = f"HTTP {search_response.status_code} error from Azure AI Search"
             
-            return jsonify({
+            return _json({
                 "error": "AI Search request failed",
                 "status": search_response.status_code,
                 "details": error_detail,
                 "auth_method": auth_method,
                 "suggestion": suggestion
-            }), search_response.status_code
+            }, search_response.status_code)
         
-        search_results = search_response.json()
+        search_results = orjson.loads(search_response.content)
+        documents = search_results.get("value", [])
         
         response_data = {
-            "message": "AI Search completed successfully",
+            "message": _SEARCH_UNIFIED_MESSAGE,
             "authentication": auth_method,
-            "flow": f"React SPA -> Python API ({auth_method}) -> Azure AI Search",
+            "flow": _SEARCH_UNIFIED_FLOWS[auth_method],
             "user_context": {
                 "oid": user_oid,
                 "upn": user_upn,
                 "groups": user_groups,
                 "group_count": len(user_groups),
-                "groups_source": "Incoming token from React (not from OBO token)"
+                "groups_source": _UNIFIED_GROUPS_SOURCE
             },
             "security_filtering": {
-                "method": "query-time access control",
+                "method": _QUERY_TIME_ACCESS_METHOD,
                 "description": filter_description,
-                "note": "Azure AI Search evaluates access based on x-ms-query-source-authorization header"
+                "note": _QUERY_TIME_ACCESS_NOTE
             },
             "search_query": search_query,
-            "result_count": search_results.get("@odata.count", len(search_results.get("value", []))),
-            "results": search_results.get("value", [])
+            "result_count": search_results.get("@odata.count", len(documents)),
+            "results": documents
         }
         
         # Add token information if OBO was used
-        if SEARCH_AUTH_MODE == "OBO" and 'search_token_decoded' in locals():
+        if search_token_decoded is not None:
             response_data["incoming_token_info"] = {
                 "aud": token_decoded.get("aud"),
                 "iss": token_decoded.get("iss"),
@@ -554,7 +783,7 @@ def search_unified():
                 "scp": token_decoded.get("scp"),
                 "groups": user_groups,
                 "group_count": len(user_groups),
-                "token_type": "Incoming Access Token from React (contains groups)"
+                "token_type": _UNIFIED_INCOMING_TOKEN_TYPE
             }
             response_data["search_token_info"] = {
                 "aud": search_token_decoded.get("aud"),
@@ -566,24 +795,25 @@ def search_unified():
                 "roles": search_token_decoded.get("roles", []),
                 "groups": search_token_decoded.get("groups", []),
                 "exp": search_token_decoded.get("exp"),
-                "token_type": "OBO Access Token for Azure AI Search (scoped for search, no groups)"
+                "token_type": _SEARCH_TOKEN_TYPE
             }
         
-        return jsonify(response_data), 200
+        return _json(response_data, 200)
         
     except Exception as e:
-        print(f"Exception in search_unified: {str(e)}")
-        return jsonify({
+        logger.exception("Exception in search_unified")
+        return _json({
             "error": "Exception occurred",
             "details": str(e)
-        }), 500
+        }, 500)
 
 @app.route('/api/health', methods=['GET'])
 def health():
     """Health check endpoint"""
-    return jsonify({"status": "healthy", "message": "Python OBO API is running"}), 200
+    return _json({"status": "healthy", "message": _HEALTH_MESSAGE}, 200)
 
 if __name__ == '__main__':
+    # Local development only - use gunicorn.conf.py in production
     print(f"Starting Python OBO API on http://{SERVER_CONFIG['host']}:{SERVER_CONFIG['port']}")
     print("OBO Flow: React SPA -> Python API -> Microsoft Graph")
     print(f"AI Search: React SPA -> Python API ({SEARCH_AUTH_MODE}) -> Azure AI Search")
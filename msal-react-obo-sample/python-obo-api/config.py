@@ -22,7 +22,11 @@ AZURE_AD_CONFIG = {
 # ============================================================================
 GRAPH_CONFIG = {
     "scopes": ["https://graph.microsoft.com/User.Read"],
-    "member_of_endpoint": "https://graph.microsoft.com/v1.0/me/memberOf"
+    "me_endpoint": "https://graph.microsoft.com/v1.0/me",
+    "member_of_endpoint": "https://graph.microsoft.com/v1.0/me/memberOf",
+    "batch_endpoint": "https://graph.microsoft.com/v1.0/$batch",
+    "use_batch": True,  # False sends /me and /me/memberOf as separate, concurrent calls
+    "request_timeout_seconds": 10
 }
 
 # ============================================================================
@@ -43,7 +47,37 @@ SEARCH_CONFIG = {
 SERVER_CONFIG = {
     "host": "0.0.0.0",
     "port": 5000,
-    "debug": True
+    "debug": os.environ.get("API_DEBUG", "true").lower() == "true",  # Set API_DEBUG=false in production
+    "workers": int(os.environ.get("GUNICORN_WORKERS", "4")),
+    "worker_class": "gevent",
+    "worker_connections": int(os.environ.get("GUNICORN_WORKER_CONNECTIONS", "500")),
+    "compress_min_size": 1024,  # Responses smaller than this (bytes) are sent uncompressed
+    "log_level": os.environ.get("LOG_LEVEL", "INFO").upper()  # "DEBUG" to trace each request
+}
+
+# ============================================================================
+# Outbound HTTP Configuration
+# ============================================================================
+HTTP_CONFIG = {
+    "pool_connections": 32,
+    # One pooled connection per concurrent request in a gevent worker, so keep-alive
+    # connections are reused rather than opened and discarded under load
+    "pool_maxsize": SERVER_CONFIG["worker_connections"],
+    # Concurrent Graph calls (GRAPH_CONFIG["use_batch"] = False) from every request
+    # in a gevent worker share this pool, so it is sized the same way
+    "max_workers": SERVER_CONFIG["worker_connections"]
+}
+
+# ============================================================================
+# Token Cache Configuration
+# ============================================================================
+CACHE_CONFIG = {
+    "obo_max_entries": 10000,
+    "obo_ttl_seconds": 300,
+    "obo_expiry_margin_seconds": 30,
+    "msal_max_entries": 10000,  # Per credential type in MSAL's in-memory token cache
+    "decode_max_entries": 10000,
+    "decode_ttl_seconds": 60
 }
 
 # ============================================================================
@@ -0,0 +1,14 @@
+"""
+Gunicorn configuration for running the Python OBO API in production
+
+Usage: gunicorn -c gunicorn.conf.py app:app
+gevent workers let many requests wait on Azure AD, Graph and AI Search concurrently.
+"""
+
+from config import SERVER_CONFIG
+
+bind = f"{SERVER_CONFIG['host']}:{SERVER_CONFIG['port']}"
+workers = SERVER_CONFIG["workers"]
+worker_class = SERVER_CONFIG["worker_class"]
+worker_connections = SERVER_CONFIG["worker_connections"]
+loglevel = SERVER_CONFIG["log_level"].lower()
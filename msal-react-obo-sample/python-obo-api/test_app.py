@@ -0,0 +1,83 @@
+"""
+Tests for the Python OBO API token caching
+Run with: python -m unittest test_app
+"""
+
+import base64
+import time
+import unittest
+from unittest import mock
+
+import orjson
+
+import app
+
+
+def make_token(claims):
+    """Build an unsigned JWT carrying the given claims"""
+    def encode(part):
+        return base64.urlsafe_b64encode(orjson.dumps(part)).rstrip(b"=").decode()
+    return f"{encode({'alg': 'none'})}.{encode(claims)}.signature"
+
+
+class AcquireOboCacheTests(unittest.TestCase):
+    def setUp(self):
+        app._obo_cache.clear()
+        app._decode_cache.clear()
+        self.msal_app = mock.Mock()
+        self.msal_app.acquire_token_on_behalf_of.return_value = {
+            "access_token": make_token({"aud": "downstream"}),
+            "expires_in": 3600
+        }
+        patcher = mock.patch.object(app, "_get_msal_app", return_value=self.msal_app)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_valid_assertion_reuses_cached_result(self):
+        token = make_token({"oid": "user", "exp": int(time.time()) + 3600})
+        app._acquire_obo(token, app.SCOPE_TUPLE)
+        app._acquire_obo(token, app.SCOPE_TUPLE)
+        self.assertEqual(self.msal_app.acquire_token_on_behalf_of.call_count, 1)
+
+    def test_expired_assertion_causes_fresh_exchange(self):
+        token = make_token({"oid": "user", "exp": int(time.time()) - 10})
+        app._acquire_obo(token, app.SCOPE_TUPLE)
+        app._acquire_obo(token, app.SCOPE_TUPLE)
+        self.assertEqual(self.msal_app.acquire_token_on_behalf_of.call_count, 2)
+
+
+class SearchOboErrorTests(unittest.TestCase):
+    def setUp(self):
+        app._obo_cache.clear()
+        self.client = app.app.test_client()
+        self.headers = {"Authorization": f"Bearer {make_token({'oid': 'user'})}"}
+
+    def test_result_without_access_token_is_reported_as_obo_failure(self):
+        with mock.patch.object(app, "_acquire_obo", return_value={}):
+            for path in ("/api/search", "/api/search-unified"):
+                response = self.client.post(path, headers=self.headers, json={"query": "*"})
+                self.assertEqual(response.status_code, 500)
+                self.assertEqual(response.get_json()["error"], "OBO token acquisition failed for AI Search")
+
+
+class GraphConcurrentCallTests(unittest.TestCase):
+    def test_timed_out_call_in_flight_is_not_reissued(self):
+        calls = []
+        
+        def slow_graph_call(url, headers):
+            calls.append(url)
+            time.sleep(0.05)
+            return 200, {"url": url}
+        
+        config = dict(app.GRAPH_CONFIG, use_batch=False, request_timeout_seconds=0.01)
+        with mock.patch.object(app, "GRAPH_CONFIG", config), \
+                mock.patch.object(app, "_get_graph_json", side_effect=slow_graph_call):
+            me, groups = app._get_me_and_groups({})
+        
+        self.assertEqual(me, (200, {"url": app.GRAPH_ME_URL}))
+        self.assertEqual(groups, (200, {"url": app.GRAPH_MEMBER_OF_URL}))
+        self.assertEqual(sorted(calls), sorted([app.GRAPH_ME_URL, app.GRAPH_MEMBER_OF_URL]))
+
+
+if __name__ == "__main__":
+    unittest.main()